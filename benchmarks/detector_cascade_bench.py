@@ -0,0 +1,92 @@
+### --- Fallback rate, accuracy and time saved by the detector cascade
+"""
+Runs DETECTOR_BACKEND alone and the detector cascade on a local image set.
+
+Accuracy is measured against the heavy backend: a frame the haar stage accepted
+counts as correct when its box overlaps the heavy backend box with IoU >= --iou.
+
+Usage:
+    python -m benchmarks.detector_cascade_bench --images data/faces
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iou(box_a:list, box_b:list) -> float:
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of face images")
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    from deepface.commons.functions import detect_face
+    from visage_auth.constant.embedding_constants import DETECTOR_BACKEND
+    from visage_auth.inference.face_detector import FaceDetectorCascade
+
+    images = []
+    for file_name in sorted(os.listdir(args.images)):
+        if file_name.lower().endswith(IMAGE_EXTENSIONS):
+            images.append(np.array(Image.open(os.path.join(args.images, file_name)).convert("RGB")))
+    if not images:
+        print("no images found")
+        return 1
+
+    cascade = FaceDetectorCascade(enabled=True)
+    ###--- Build both detectors before timing anything
+    detect_face(images[0],detector_backend=DETECTOR_BACKEND,enforce_detection=False,)
+    cascade.detect_cheap(images[0])
+
+    heavy_seconds = 0.0
+    cascade_seconds = 0.0
+    accepted = 0
+    agreed = 0
+    for img_array in images:
+        start = time.perf_counter()
+        heavy_face, heavy_region = detect_face(img_array,detector_backend=DETECTOR_BACKEND,
+                                               enforce_detection=False,)
+        heavy_seconds += time.perf_counter() - start
+
+        face, region, _ = cascade.detect_cheap(img_array)
+        if face is not None:
+            accepted += 1
+            agreed += iou(region, heavy_region) >= args.iou
+
+        start = time.perf_counter()
+        try:
+            cascade.detect(img_array)
+        except ValueError:
+            pass
+        cascade_seconds += time.perf_counter() - start
+
+    stats = cascade.stats()
+    print(f"{len(images)} frames, heavy backend {DETECTOR_BACKEND}\n")
+    print(f"cheap stage accepted   {stats['cheap_accepted']}")
+    for reason in FaceDetectorCascade.FALLBACK_REASONS:
+        print(f"fallback {reason:<14}{stats['fallback_' + reason]}")
+    print(f"fallback rate          {stats['fallback_rate']:.1%}")
+    print(f"cheap stage accuracy   {agreed / accepted if accepted else 0.0:.1%} (IoU >= {args.iou})")
+    print(f"heavy only             {heavy_seconds * 1000 / len(images):.1f} ms/frame")
+    print(f"cascade                {cascade_seconds * 1000 / len(images):.1f} ms/frame")
+    print(f"detection time saved   {1 - cascade_seconds / heavy_seconds:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+### --- Per call time of email validation on adversarial inputs
+"""
+Times the shared email validator against the per request pattern it replaced, on
+inputs built to make the old nested quantifier backtrack, and checks that both
+accept and reject the same addresses.
+
+The old pattern is only run up to --old-max-length characters because its time
+roughly doubles with every extra character.
+
+Usage:
+    python -m benchmarks.email_validation_bench
+"""
+import re
+import sys
+import time
+import random
+import argparse
+
+from visage_auth.business_val.email_val import EMAIL_MAX_LENGTH, is_email_valid
+
+
+OLD_REGEX = re.compile(r"([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+")
+
+VALID_ADDRESSES = ["john.doe@example.com", "a_b-c@x-y.co.uk", "user1@mail.io", "a@b.cd",
+                   "first.last_name@sub-domain.example.org", "X9@Y9.ZZ"]
+
+
+def adversarial_inputs(length:int) -> dict:
+    return {"digits then junk": "0" * length + "!",
+            "dotted words then junk": "a." * (length // 2) + "!",
+            "local part, no domain": "a" * length + "@",
+            "long tld run": "a@b" + ".cc" * (length // 3) + "!",
+            "many @": "a@" * (length // 2) + "b.cc!",}
+
+
+def time_call(validate, value:str, repeat:int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        validate(value)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def check_parity(samples:int) -> int:
+    alphabet = "aZ09.-_@|/:<[\\^!x"
+    rng = random.Random(0)
+    values = VALID_ADDRESSES + ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 14)))
+                                for _ in range(samples)]
+    return sum(bool(OLD_REGEX.fullmatch(value)) != is_email_valid(value) for value in values)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--old-max-length", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--parity-samples", type=int, default=100000)
+    args = parser.parse_args()
+
+    mismatches = check_parity(args.parity_samples)
+    print(f"parity with the old pattern: {mismatches} mismatches\n")
+
+    print(f"{'input':<24}{'length':>8}{'old us/call':>14}{'new us/call':>14}")
+    worst_new = 0.0
+    for length in (8, 16, args.old_max_length, EMAIL_MAX_LENGTH - 4, 10000, 1000000):
+        for name, value in adversarial_inputs(length).items():
+            old = "-"
+            if len(value) <= args.old_max_length + 2:
+                old = f"{time_call(OLD_REGEX.fullmatch, value, 1):.1f}"
+            new = time_call(is_email_valid, value, args.repeat)
+            worst_new = max(worst_new, new)
+            print(f"{name:<24}{len(value):>8}{old:>14}{new:>14.1f}")
+
+    print(f"\nworst new per call time: {worst_new:.1f} us")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
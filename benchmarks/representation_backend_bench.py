@@ -0,0 +1,181 @@
+### --- Parity and cost of the representation backends
+"""
+Compares every representation backend against DeepFace on the faces of a local image set.
+
+Each backend runs in its own process so the resident memory reported is the one of that
+backend alone. A backend that cannot be built or crashes is reported as failed, e.g. the
+ONNX ones when onnxruntime is missing or the graphs were not exported yet. The faces are detected once, in the parent, with DETECTOR_BACKEND.
+
+Usage:
+    python -m benchmarks.representation_backend_bench --images data/faces
+    python -m benchmarks.representation_backend_bench --images data/faces --export --quantize
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import multiprocessing as mp
+from queue import Empty
+
+import numpy as np
+from PIL import Image
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_faces(image_dir:str) -> list:
+    from deepface.commons.functions import detect_face
+    from visage_auth.constant.embedding_constants import DETECTOR_BACKEND
+
+    faces = []
+    for file_name in sorted(os.listdir(image_dir)):
+        if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img_array = np.array(Image.open(os.path.join(image_dir, file_name)).convert("RGB"))
+        try:
+            faces.append(detect_face(img_array,detector_backend=DETECTOR_BACKEND,
+                                     enforce_detection=True,)[0])
+        except ValueError:
+            print(f"skipping {file_name}: no face detected")
+    return faces
+
+
+def measure_backend(name:str, faces:list, iterations:int) -> dict:
+    from visage_auth.inference.representation_backend import (DeepFaceBackend,
+                                                              OnnxRuntimeBackend)
+
+    rss_before = current_rss_mb()
+    if name == "deepface":
+        backend = DeepFaceBackend()
+    else:
+        backend = OnnxRuntimeBackend(quantized=(name == "onnxruntime-int8"))
+    rss_loaded = current_rss_mb()
+
+    ###--- Warm up so lazy initialisation is not timed
+    embeddings = [backend.represent(face) for face in faces]
+
+    latencies = []
+    for _ in range(iterations):
+        for face in faces:
+            start = time.perf_counter()
+            backend.represent(face)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return {"name": name, "embeddings": embeddings, "latencies": latencies,
+            "rss_before": rss_before, "rss_loaded": rss_loaded,
+            "rss_peak": peak_rss_mb()}
+
+
+def run_backend(name:str, faces:list, iterations:int, queue) -> None:
+    """
+        Child process entry, an exception is sent back as an error record so
+        the parent never waits for a result that will not come
+    """
+    try:
+        queue.put(measure_backend(name, faces, iterations))
+    except Exception as e:
+        queue.put({"name": name, "error": f"{type(e).__name__}: {e}"})
+
+
+def collect_result(name:str, process, queue) -> dict:
+    """
+        Result of a backend process, an error record when it died without one
+    """
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if process.is_alive():
+                continue
+        ###--- The result may still be in flight when the process has just exited
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            return {"name": name, "error": f"process exited with code {process.exitcode}"}
+
+
+def cosine_distance(a, b) -> float:
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return 1 - float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of face images")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--backends", nargs="+",
+                        default=["deepface", "onnxruntime", "onnxruntime-int8"])
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="maximum cosine distance to DeepFace for fp32 graphs")
+    parser.add_argument("--int8-tolerance", type=float, default=0.05,
+                        help="maximum cosine distance to DeepFace for the INT8 graph")
+    parser.add_argument("--export", action="store_true", help="export the ONNX graph first")
+    parser.add_argument("--quantize", action="store_true", help="build the INT8 graph first")
+    args = parser.parse_args()
+
+    from visage_auth.inference.representation_backend import (export_onnx_model,
+                                                              quantize_onnx_model)
+    if args.export:
+        export_onnx_model()
+    if args.quantize:
+        quantize_onnx_model()
+
+    faces = load_faces(args.images)
+    if not faces:
+        print("no faces found")
+        return 1
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for name in args.backends:
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_backend, args=(name, faces, args.iterations, queue))
+        process.start()
+        results[name] = collect_result(name, process, queue)
+        process.join()
+
+    print(f"{len(faces)} faces, {args.iterations} iterations\n")
+    print(f"{'backend':<18}{'p50 ms':>9}{'p95 ms':>9}{'load MB':>10}{'peak MB':>10}{'max dist':>10}")
+    failed = False
+    reference = results.get("deepface")
+    if reference is not None and "error" in reference:
+        reference = None
+    for name, result in results.items():
+        if "error" in result:
+            failed = True
+            print(f"{name:<18}FAILED  {result['error']}")
+            continue
+        latencies = np.array(result["latencies"])
+        max_distance = float("nan")
+        if reference is not None:
+            max_distance = max(cosine_distance(ref, emb) for ref, emb
+                               in zip(reference["embeddings"], result["embeddings"]))
+            tolerance = args.int8_tolerance if name.endswith("int8") else args.tolerance
+            failed = failed or max_distance > tolerance
+        print(f"{name:<18}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+              f"{result['rss_loaded'] - result['rss_before']:>10.1f}{result['rss_peak']:>10.1f}"
+              f"{max_distance:>10.4f}")
+
+    if failed:
+        print("\nparity check FAILED")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
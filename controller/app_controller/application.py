@@ -1,17 +1,35 @@
 import os
+import asyncio
+import contextvars
 from typing import List
-from fastapi import APIRouter, File, Request
+from fastapi import APIRouter, File, Request, WebSocket
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import JSONResponse, RedirectResponse
 from controller.auth_controller.authentication import get_current_user
-from visage_auth.business_val.user_embedding_val import (UserLoginEmbeddingValidation,
+from visage_auth.business_val.user_embedding_val import (UserBatchEmbeddingValidation,
+                                                       UserLoginEmbeddingValidation,
                                                        UserRegisterEmbeddingValidation,)
+from visage_auth.constant.inference_constants import (STREAM_MAX_FRAMES,
+                                                      STREAM_QUEUE_SIZE,
+                                                      STREAM_REQUIRED_EMBEDDINGS,
+                                                      STREAM_WORKERS,
+                                                      VERIFY_BATCH_MAX_SIZE)
+from visage_auth.logger import logging
+from visage_auth.inference.embedding_cache import get_embedding_cache
+from visage_auth.inference.face_detector import get_face_detector
+from visage_auth.monitoring.memory_tracker import MemoryBudgetExceeded, memory_stats
 
 
 router = APIRouter(prefix="/application",tags=["application"],
                    responses={"401":{"description":"Not Authorized!!!"}},)
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 
 @router.post("/register_embedding")
@@ -43,8 +61,238 @@ async def register_embedding(request: Request,
                                 content={"status": True, "message": msg},
                                 headers={"uuid": uuid},)
         return response
+    except MemoryBudgetExceeded as e:
+        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            content={"status": False, "message": str(e)},)
     except Exception as e:
         msg = "Error in Storing Embedding in Database"
         response = JSONResponse(status_code=status.HTTP_404_NOT_FOUND,
                                 content={"status": True, "message": msg},)
         return response
+
+
+
+class VerifyBatchTooLarge(Exception):
+    """
+        Raised by read_verify_batch before any frame is read
+    """
+
+
+async def read_verify_batch(request: Request):
+    """
+        Reads the (uuid, frame) pairs of a batch verification request, either a
+        multipart form with repeated "uuids" and "files" fields in the same order,
+        or a msgpack body {"items": [{"uuid": str, "frame": bytes}, ...]}.
+        The number of pairs is checked against VERIFY_BATCH_MAX_SIZE before the
+        frames are read or collected.
+    """
+    if request.headers.get("content-type", "").startswith("application/msgpack"):
+        if msgpack is None:
+            raise ValueError("msgpack is not installed on the server")
+        body = msgpack.unpackb(await request.body(), raw=False)
+        items = body.get("items", [])
+        if len(items) > VERIFY_BATCH_MAX_SIZE:
+            raise VerifyBatchTooLarge()
+        return [item["uuid"] for item in items], [item["frame"] for item in items]
+
+    form = await request.form()
+    uuids = [str(uuid_) for uuid_ in form.getlist("uuids")]
+    uploads = form.getlist("files")
+    if max(len(uuids), len(uploads)) > VERIFY_BATCH_MAX_SIZE:
+        raise VerifyBatchTooLarge()
+    files = [await upload.read() for upload in uploads]
+    return uuids, files
+
+
+@router.post("/verify_batch")
+async def verify_batch(request: Request):
+    """
+        Verifies many (uuid, frame) pairs in one request for gate and kiosk devices
+
+        Args:
+            request (Request): multipart form or msgpack body, see read_verify_batch
+
+        Returns:
+            Response: one result per pair, in request order
+    """
+    try:
+        user = await get_current_user(request)
+        if not isinstance(user, dict):
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED,
+                                content={"status": False, "message": "Not Authorized!!!"},)
+
+        try:
+            uuids, files = await read_verify_batch(request)
+        except VerifyBatchTooLarge:
+            msg = f"Batch is limited to {VERIFY_BATCH_MAX_SIZE} frames"
+            return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                content={"status": False, "message": msg},)
+        if len(uuids) != len(files) or len(uuids) == 0:
+            msg = "Every uuid needs exactly one frame"
+            return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                content={"status": False, "message": msg},)
+
+        batch_validation = UserBatchEmbeddingValidation()
+        ###--- Run in a copy of the request context so the memory budget follows into the thread
+        context = contextvars.copy_context()
+        results = await run_in_threadpool(context.run, batch_validation.verify_batch, uuids, files)
+        return JSONResponse(status_code=status.HTTP_200_OK,
+                            content={"status": True, "results": results},)
+    except MemoryBudgetExceeded as e:
+        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            content={"status": False, "message": str(e)},)
+    except Exception as e:
+        msg = "Error in Batch Verification"
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"status": False, "message": msg},)
+
+
+async def finish_stream(mode: str, uuid: str, embedding_list: list) -> dict:
+    """
+        Saves (register) or compares (login) the embeddings collected on a stream
+    """
+    if len(embedding_list) < STREAM_REQUIRED_EMBEDDINGS:
+        msg = f"Only {len(embedding_list)} of {STREAM_REQUIRED_EMBEDDINGS} frames had a usable face"
+        return {"status": False, "message": msg}
+
+    if mode == "login":
+        def compare_embedding_list():
+            return UserLoginEmbeddingValidation(uuid).compare_embedding_list(embedding_list)
+        matched, similarity = await run_in_threadpool(compare_embedding_list)
+        msg = "Face Matched" if matched else "Face does not match"
+        return {"status": matched, "message": msg, "similarity": similarity}
+
+    def save_embedding_list():
+        UserRegisterEmbeddingValidation(uuid).save_embedding_list(embedding_list)
+    await run_in_threadpool(save_embedding_list)
+    return {"status": True, "message": "Embedding Stored Successfully in Database"}
+
+
+@router.websocket("/ws/embedding")
+async def stream_embedding(websocket: WebSocket, mode: str = "register"):
+    """
+        Takes frames while they are captured, for enrollment (mode=register) or
+        face login (mode=login), and closes as soon as enough good embeddings exist.
+        Decode, detection and embedding of earlier frames run on the threadpool while
+        later frames arrive. At most STREAM_QUEUE_SIZE frames wait for processing,
+        beyond that the socket is not read, so a fast client is slowed down by TCP.
+
+        Protocol:
+            client: one binary message per encoded frame, the text "done" when capture stops
+            server: {"type": "frame", "index", "status", "collected"} per processed frame,
+                    {"type": "throttle"} when frames arrive faster than they are processed,
+                    {"type": "result", "status", "message"} before closing, the stream closes
+                    with code 1009 when a frame exceeds the request memory budget
+    """
+    await websocket.accept()
+    try:
+        uuid = None
+        if mode == "login":
+            user = await get_current_user(websocket)
+            uuid = user.get("uuid") if isinstance(user, dict) else None
+        elif mode == "register":
+            uuid = websocket.session.get("uuid")
+    except Exception as e:
+        uuid = None
+    if uuid is None:
+        await websocket.send_json({"type": "result", "status": False, "message": "Not Authorized!!!"})
+        await websocket.close(code=1008)
+        return
+
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    embedding_list = []
+    budget_errors = []
+    enough = asyncio.Event()
+
+    async def receive_frames():
+        frame_count = 0
+        try:
+            while frame_count < STREAM_MAX_FRAMES:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is None:
+                    if message.get("text") == "done":
+                        break
+                    continue
+                if queue.full():
+                    await websocket.send_json({"type": "throttle"})
+                await queue.put((frame_count, message["bytes"]))
+                frame_count += 1
+        except Exception as e:
+            logging.info(f"Frame stream ended: {e}")
+        ###--- One end marker per worker, not in a finally: after cancellation nobody drains the queue
+        for _ in range(STREAM_WORKERS):
+            await queue.put(None)
+
+    async def process_frames():
+        while not enough.is_set():
+            item = await queue.get()
+            if item is None:
+                return
+            index, contents = item
+            try:
+                ###--- A fresh copy per frame, a context cannot be entered by two threads at once
+                context = contextvars.copy_context()
+                embed = await run_in_threadpool(context.run,
+                                                UserLoginEmbeddingValidation.generate_embedding_from_bytes,
+                                                contents)
+                del contents
+                embedding_list.append(embed)
+                frame_status = {"status": True}
+                if len(embedding_list) >= STREAM_REQUIRED_EMBEDDINGS:
+                    enough.set()
+            except MemoryBudgetExceeded as e:
+                ###--- Like the 413 of the HTTP routes: the whole stream ends, not just this frame
+                budget_errors.append(str(e))
+                enough.set()
+                return
+            except Exception as e:
+                frame_status = {"status": False, "message": "No usable face in frame"}
+            await websocket.send_json({"type": "frame", "index": index,
+                                       "collected": len(embedding_list), **frame_status})
+
+    receiver = asyncio.create_task(receive_frames())
+    workers = asyncio.gather(*[process_frames() for _ in range(STREAM_WORKERS)])
+    enough_wait = asyncio.ensure_future(enough.wait())
+    try:
+        await asyncio.wait({workers, enough_wait}, return_when=asyncio.FIRST_COMPLETED)
+        if budget_errors:
+            await websocket.send_json({"type": "result", "status": False, "message": budget_errors[0]})
+            await websocket.close(code=1009)
+            return
+        ###--- Workers still run until the finally below, finish_stream gets a snapshot
+        result = await finish_stream(mode, uuid, list(embedding_list))
+        await websocket.send_json({"type": "result", **result})
+        await websocket.close()
+    except Exception as e:
+        msg = "Error in Streaming Embedding"
+        try:
+            await websocket.send_json({"type": "result", "status": False, "message": msg})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        for task in (receiver, workers, enough_wait):
+            task.cancel()
+        await asyncio.gather(receiver, workers, enough_wait, return_exceptions=True)
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """
+        Inference counters of this worker, for logged in users only since the
+        memory figures name routes and the cache counters reveal traffic
+
+        Returns:
+            Response: detector cascade stage counters and timings, embedding cache hit rate,
+                      peak memory per route and per stage of the sampled requests
+    """
+    user = await get_current_user(request)
+    if not isinstance(user, dict):
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED,
+                            content={"status": False, "message": "Not Authorized!!!"},)
+    return JSONResponse(status_code=status.HTTP_200_OK,
+                        content={"detector_cascade": get_face_detector().stats(),
+                                 "embedding_cache": get_embedding_cache().stats(),
+                                 "memory": memory_stats.stats(),},)
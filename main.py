@@ -8,9 +8,14 @@ from starlette.middleware.sessions import SessionMiddleware #Middleware for mana
 from controller.app_controller import application
 from controller.auth_controller import authenticate
 from visage_auth.constant.application import APP_HOST, APP_PORT
+from visage_auth.monitoring.memory_tracker import MemoryAccountingMiddleware
+from visage_auth.monitoring.profiling import ProfilingMiddleware, profiling_enabled
 
 
 app = FastAPI()
+app.add_middleware(MemoryAccountingMiddleware) #per request memory budget and tracemalloc sampling
+if profiling_enabled(): #not installed at all unless PROFILING_SECRET or PROFILING_SAMPLE_RATE is set
+    app.add_middleware(ProfilingMiddleware)
 
 @app.get('/') #this defines a function named read_root that handles GET requests to the root path (/)
 def read_root():
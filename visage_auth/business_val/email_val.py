@@ -0,0 +1,30 @@
+### --- Email validation shared by login and registration
+import re
+
+
+###--- Longest address accepted (RFC 5321 forward-path limit), checked before any matching
+EMAIL_MAX_LENGTH = 254
+
+###--- Accepts exactly the addresses of the previous per request pattern
+###---     ([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+
+###--- whose nested quantifier backtracks exponentially on inputs like "0000...0!".
+###--- [.-_] is the range "." to "_", its non alphanumeric members are spelled out so a
+###--- separator can no longer also be read as part of a word. The domain cannot contain
+###--- "@", so the address is split on its last "@" and each side has a single way to match.
+LOCAL_PART_REGEX = re.compile(r"[A-Za-z0-9]+(?:[./:;<=>?@\[\\\]^_][A-Za-z0-9]+)*")
+DOMAIN_REGEX = re.compile(r"[A-Za-z0-9-]+(?:\.[A-Z|a-z]{2,})+")
+
+
+def is_email_valid(email_id: str) -> bool:
+    """
+    Validates email id
+
+    Returns:
+        bool: True if email id is valid else False
+    """
+    if not isinstance(email_id, str) or len(email_id) > EMAIL_MAX_LENGTH:
+        return False
+    local_part, at, domain = email_id.rpartition("@")
+    if not at:
+        return False
+    return LOCAL_PART_REGEX.fullmatch(local_part) is not None and DOMAIN_REGEX.fullmatch(domain) is not None
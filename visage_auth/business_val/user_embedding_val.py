@@ -3,16 +3,17 @@ import sys
 import numpy as np
 from ast import Bytes
 from PIL import Image
-from typing import List
-from deepface import DeepFace
+from typing import List, Tuple
 from visage_auth.logger import logging
 from visage_auth.exception import AppException
-from deepface.commons.functions import detect_face
 from visage_auth.data_access.user_embedding_data import UserEmbeddingData
-from visage_auth.constant.embedding_constants import (DETECTOR_BACKEND,
-                                                      EMBEDDING_MODEL_NAME,
-                                                      ENFORCE_DETECTION,
-                                                      SIMILARITY_THRESHOLD)
+from visage_auth.inference.embedding_cache import get_embedding_cache
+from visage_auth.inference.face_detector import get_face_detector
+from visage_auth.inference.representation_backend import get_representation_backend
+from visage_auth.monitoring.memory_tracker import (MemoryBudgetExceeded,
+                                                   get_memory_budget,
+                                                   memory_stage)
+from visage_auth.constant.embedding_constants import SIMILARITY_THRESHOLD
 
 
 class UserLoginEmbeddingValidation:
@@ -39,15 +40,115 @@ class UserLoginEmbeddingValidation:
             Generate embedding from image array
         """
         try:
-            faces = detect_face(img_array,detector_backend=DETECTOR_BACKEND,
-                                enforce_detection=ENFORCE_DETECTION,)
+            with memory_stage("detect"):
+                faces = get_face_detector().detect(img_array)
             # Generate embedding from face
-            embed = DeepFace.represent(img_path=faces[0],model_name=EMBEDDING_MODEL_NAME,
-                                       enforce_detection=False,)
+            with memory_stage("represent"):
+                embed = get_representation_backend().represent(faces[0])
             return embed
         except Exception as e:
             raise AppException(e,sys) from e
 
+    @staticmethod
+    def decode_image(contents:Bytes) -> Tuple[np.ndarray, int]:
+        """
+            Decode an uploaded image to an RGB array after reserving its size in the
+            request memory budget, the caller releases it once the array is dropped.
+            RGBA, palette and grayscale uploads are converted, so the detector and
+            the representation backend always get three channels.
+
+            Returns:
+                tuple: (RGB image array, reserved bytes)
+        """
+        with memory_stage("decode"):
+            with Image.open(io.BytesIO(contents)) as img:
+                ###--- Size of the RGB array comes from the header, nothing is decoded before the check
+                decoded_bytes = img.width * img.height * 3
+                get_memory_budget().reserve(decoded_bytes, "decoded image")
+                try:
+                    rgb = img if img.mode == "RGB" else img.convert("RGB")
+                    return np.array(rgb), decoded_bytes
+                except Exception:
+                    get_memory_budget().release(decoded_bytes)
+                    raise
+
+    @staticmethod
+    def generate_embedding_from_bytes(contents:Bytes) -> List[float]:
+        """
+            Generate embedding from the bytes of an uploaded image,
+            a retried or repeated upload is served from the embedding cache
+        """
+        try:
+            cache = get_embedding_cache()
+            key = cache.key(contents)
+            embed = cache.get(key)
+            if embed is not None:
+                return embed
+
+            img_array, decoded_bytes = UserLoginEmbeddingValidation.decode_image(contents)
+            try:
+                embed = UserLoginEmbeddingValidation.generate_embedding(img_array)
+            finally:
+                del img_array
+                get_memory_budget().release(decoded_bytes)
+            cache.put(key, embed)
+            return embed
+        except MemoryBudgetExceeded:
+            raise
+        except Exception as e:
+            raise AppException(e,sys) from e
+
+    @staticmethod
+    def generate_embedding_list(files:List[Bytes]) -> List[List[float]]:
+        """
+            Generate embedding list from the bytes of the uploaded images.
+            Images are handled one at a time and each entry of files is cleared
+            once embedded so its bytes can be freed before the next one is decoded.
+        """
+        budget = get_memory_budget()
+        upload_bytes = sum(len(contents) for contents in files)
+        budget.reserve(upload_bytes, "uploaded images")
+        try:
+            embedding_list = []
+            for i, contents in enumerate(files):
+                embedding_list.append(UserLoginEmbeddingValidation.generate_embedding_from_bytes(contents))
+                files[i] = None
+                budget.release(len(contents))
+                upload_bytes -= len(contents)
+                del contents
+            return embedding_list
+        finally:
+            budget.release(upload_bytes)
+
+    @staticmethod
+    def average_embedding(embedding_list:List[List[float]]) -> List[float]:
+        """
+            Average the embeddings of all images of a user
+        """
+        avg_embed = np.mean(embedding_list, axis=0)
+        return avg_embed.tolist()
+
+    @staticmethod
+    def cosine_similarity(db_embedding:List[float], current_embedding:List[float]) -> float:
+        db_embedding = np.asarray(db_embedding)
+        current_embedding = np.asarray(current_embedding)
+        return float(np.dot(db_embedding, current_embedding) /
+                     (np.linalg.norm(db_embedding) * np.linalg.norm(current_embedding)))
+
+    def compare_embedding_list(self,embedding_list:List[List[float]]) -> Tuple[bool, float]:
+        """
+            Compares the averaged embeddings of the captured frames with the stored one
+
+            Returns:
+                tuple: (True if the face matches, cosine similarity)
+        """
+        try:
+            avg_embedding = UserLoginEmbeddingValidation.average_embedding(embedding_list)
+            similarity = UserLoginEmbeddingValidation.cosine_similarity(self.user["user_embed"], avg_embedding)
+            return similarity >= SIMILARITY_THRESHOLD, similarity
+        except Exception as e:
+            raise AppException(e,sys) from e
+
 
 class UserRegisterEmbeddingValidation:
     def __init__(self,uuid_:str) -> None:
@@ -65,8 +166,125 @@ class UserRegisterEmbeddingValidation:
         """
         try:
             embedding_list = UserLoginEmbeddingValidation.generate_embedding_list(files)
+            self.save_embedding_list(embedding_list)
+        
+        except MemoryBudgetExceeded:
+            raise
+        except Exception as e:
+            raise AppException(e,sys) from e
+
+    def save_embedding_list(self,embedding_list:List[List[float]]):
+        """
+            Averages already generated embeddings and saves them to database
+        """
+        try:
             avg_embedding_list = UserLoginEmbeddingValidation.average_embedding(embedding_list)
             self.user_embedding_data.save_user_embedding(self.uuid_, avg_embedding_list)
-        
         except Exception as e:
-            raise AppException(e,sys) from e
\ No newline at end of file
+            raise AppException(e,sys) from e
+
+
+class UserBatchEmbeddingValidation:
+    """
+        Verifies many (uuid, frame) pairs at once: one $in query for the stored
+        embeddings, one batched forward pass and a vectorized cosine similarity
+    """
+    def __init__(self) -> None:
+        self.user_embedding_data = UserEmbeddingData()
+
+    def get_user_embeddings(self,uuids:List[str]) -> dict:
+        records = self.user_embedding_data.collection.find({"UUID": {"$in": list(set(uuids))}},
+                                                           {"UUID": 1, "user_embed": 1})
+        return {record["UUID"]: record["user_embed"] for record in records
+                if record.get("user_embed") is not None}
+
+    @staticmethod
+    def generate_embeddings(files:List[Bytes]) -> Tuple[list, list]:
+        """
+            Embeddings of all frames, the frames missing from the embedding cache
+            go through the representation backend in a single batch
+
+            Returns:
+                tuple: (embeddings, errors), one entry per frame, None where not set
+        """
+        cache = get_embedding_cache()
+        budget = get_memory_budget()
+        embeddings = [None] * len(files)
+        errors = [None] * len(files)
+        keys, faces, positions = [], [], []
+        for i, contents in enumerate(files):
+            try:
+                key = cache.key(contents)
+                embed = cache.get(key)
+                if embed is not None:
+                    embeddings[i] = embed
+                    continue
+                ###--- Only the face crops are kept until the batched forward pass
+                img_array, decoded_bytes = UserLoginEmbeddingValidation.decode_image(contents)
+                try:
+                    with memory_stage("detect"):
+                        faces.append(get_face_detector().detect(img_array)[0])
+                finally:
+                    del img_array
+                    budget.release(decoded_bytes)
+                keys.append(key)
+                positions.append(i)
+            except MemoryBudgetExceeded:
+                ###--- Over the request budget is a 413 for the whole batch, not a bad frame
+                raise
+            except Exception as e:
+                logging.info(f"Frame {i} of the batch has no usable face: {e}")
+                errors[i] = "No usable face in frame"
+
+        if faces:
+            try:
+                with memory_stage("represent"):
+                    batch_embeddings = get_representation_backend().represent_batch(faces)
+                del faces
+                for key, i, embed in zip(keys, positions, batch_embeddings):
+                    cache.put(key, embed)
+                    embeddings[i] = embed
+            except Exception as e:
+                logging.info(f"Batched representation failed: {e}")
+                for i in positions:
+                    errors[i] = "Embedding failed"
+        return embeddings, errors
+
+    def verify_batch(self,uuids:List[str],files:List[Bytes]) -> List[dict]:
+        """
+            Compares every frame with the stored embedding of its uuid,
+            a bad frame or unknown uuid only fails its own item
+
+            Returns:
+                list: {"uuid", "status", "similarity", "message"} per pair, in request order
+        """
+        try:
+            get_memory_budget().reserve(sum(len(contents) for contents in files), "uploaded frames")
+            stored = self.get_user_embeddings(uuids)
+            embeddings, errors = self.generate_embeddings(files)
+
+            results = [{"uuid": uuid_, "status": False, "similarity": None, "message": errors[i]}
+                       for i, uuid_ in enumerate(uuids)]
+            scored = []
+            for i, uuid_ in enumerate(uuids):
+                if errors[i] is not None:
+                    continue
+                if uuid_ not in stored:
+                    results[i]["message"] = "User embedding not found"
+                    continue
+                scored.append(i)
+
+            if scored:
+                db_embeddings = np.asarray([stored[uuids[i]] for i in scored], dtype=np.float32)
+                current_embeddings = np.asarray([embeddings[i] for i in scored], dtype=np.float32)
+                similarity = np.sum(db_embeddings * current_embeddings, axis=1) / (
+                    np.linalg.norm(db_embeddings, axis=1) * np.linalg.norm(current_embeddings, axis=1))
+                for i, score in zip(scored, similarity.tolist()):
+                    results[i]["similarity"] = score
+                    results[i]["status"] = score >= SIMILARITY_THRESHOLD
+                    results[i]["message"] = "Verified" if results[i]["status"] else "Face does not match"
+            return results
+        except MemoryBudgetExceeded:
+            raise
+        except Exception as e:
+            raise AppException(e,sys) from e
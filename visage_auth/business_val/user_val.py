@@ -1,5 +1,4 @@
 ### --- Validating registration
-import re
 import sys
 from typing import Optional
 
@@ -8,6 +7,7 @@ from passlib.context import CryptContext #hashing password
 from visage_auth.logger import logging
 from visage_auth.entity.user import User
 from visage_auth.exception import AppException
+from visage_auth.business_val.email_val import is_email_valid
 from visage_auth.data_access.user_data import UserData
 
 
@@ -23,7 +23,6 @@ class LoginValidation:
         """
         self.email_id = email_id
         self.password = password
-        self.regex = re.compile(r"([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+")
 
     def validate(self) -> bool:
         """
@@ -46,10 +45,7 @@ class LoginValidation:
             raise e
 
     def is_email_valid(self) -> bool:
-        if re.fullmatch(self.regex, self.email_id):
-            return True
-        else:
-            return False
+        return is_email_valid(self.email_id)
 
     def verify_password(self, plain_password:str, hashed_password:str) -> bool:
         """
@@ -69,8 +65,9 @@ class LoginValidation:
         """
         Checks all validation conditions for user registration
         """
-        if len(self.validate()) != 0:
-            return {"status": False, "msg": self.validate()}
+        msg = self.validate()
+        if len(msg) != 0:
+            return {"status": False, "msg": msg}
         return {"status": True}
 
     def authenticate_user_login(self) -> Optional[str]:
@@ -104,12 +101,12 @@ class RegisterValidation:
     """
     Authenticates user and returns status
     """
-    def __init__(self, user: User) -> None:
+    def __init__(self, user: User, userdata: Optional[UserData] = None) -> None:
         try:
             self.user = user
-            self.regex = re.compile(r"([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+")
             self.uuid = self.user.uuid_
-            self.userdata = UserData()
+            ###--- Bulk callers pass a shared UserData instead of opening one per user
+            self.userdata = userdata if userdata is not None else UserData()
             self.bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
         except Exception as e:
             raise e
@@ -119,6 +116,23 @@ class RegisterValidation:
         """
         Checks all validation conditions for user registration
 
+        Returns:
+            _type_: string
+        """
+        try:
+            msg = self.validate_details()
+
+            if not self.is_details_exists():
+                msg += "User already exists"
+
+            return msg
+        except Exception as e:
+            raise e
+
+    def validate_details(self) -> str:
+        """
+        Checks the validation conditions that do not need the database
+
         Returns:
             _type_: string
         """
@@ -151,9 +165,6 @@ class RegisterValidation:
             if not self.is_password_match():
                 msg += "Password does not match"
 
-            if not self.is_details_exists():
-                msg += "User already exists"
-
             return msg
         except Exception as e:
             raise e
@@ -165,10 +176,7 @@ class RegisterValidation:
         Returns:
             bool: True if email id is valid else False
         """
-        if re.fullmatch(self.regex,self.user.email_id):
-            return True
-        else:
-            return False
+        return is_email_valid(self.user.email_id)
 
     def is_password_valid(self) -> bool:
         if len(self.user.password1) >= 8 and len(self.user.password2) <= 16:
@@ -198,8 +206,9 @@ class RegisterValidation:
         """
         Checks all validation conditions for user registration
         """
-        if len(self.validate()) != 0:
-            return {"status":False, "msg":self.validate()}
+        msg = self.validate()
+        if len(msg) != 0:
+            return {"status":False, "msg":msg}
         return {"status":True}
 
     def authenticate_user_registration(self) -> bool:
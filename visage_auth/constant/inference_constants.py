@@ -0,0 +1,39 @@
+import os
+
+
+###--- Representation backend used to turn a detected face into an embedding
+###--- "deepface" runs the TensorFlow model, "onnxruntime" runs an exported ONNX graph on CPU
+REPRESENTATION_BACKEND = os.getenv("REPRESENTATION_BACKEND", "deepface")
+
+###--- Directory holding the exported graphs, named <EMBEDDING_MODEL_NAME>.onnx
+###--- and <EMBEDDING_MODEL_NAME>.int8.onnx for the dynamically quantized variant
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getcwd(), "models"))
+ONNX_USE_QUANTIZED = os.getenv("ONNX_USE_QUANTIZED", "false").lower() == "true"
+
+###--- 0 lets ONNX Runtime pick the number of intra-op threads
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+###--- Detector cascade: OpenCV haar cascade first, DETECTOR_BACKEND only when it is unsure
+DETECTOR_CASCADE_ENABLED = os.getenv("DETECTOR_CASCADE_ENABLED", "true").lower() == "true"
+###--- Minimum haar level weight for the cheap stage to be trusted
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "4.0"))
+CASCADE_MIN_FACE_SIZE = int(os.getenv("CASCADE_MIN_FACE_SIZE", "64"))
+
+###--- Embedding cache keyed by a hash of the uploaded image bytes
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+###--- Set to a directory to keep cached embeddings across restarts
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+
+###--- Largest number of (uuid, frame) pairs accepted by /application/verify_batch
+VERIFY_BATCH_MAX_SIZE = int(os.getenv("VERIFY_BATCH_MAX_SIZE", "64"))
+
+###--- WebSocket capture on /application/ws/embedding
+###--- Good embeddings needed before the stream is closed
+STREAM_REQUIRED_EMBEDDINGS = int(os.getenv("STREAM_REQUIRED_EMBEDDINGS", "5"))
+###--- Frames received but not yet processed, the socket is not read while it is full
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "4"))
+###--- Frames decoded, detected and embedded concurrently
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "2"))
+###--- Frames accepted on one stream before giving up
+STREAM_MAX_FRAMES = int(os.getenv("STREAM_MAX_FRAMES", "50"))
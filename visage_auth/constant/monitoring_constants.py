@@ -0,0 +1,18 @@
+import os
+
+
+###--- tracemalloc sampling of requests, reported on /application/metrics
+MEMORY_PROFILING_ENABLED = os.getenv("MEMORY_PROFILING_ENABLED", "false").lower() == "true"
+MEMORY_PROFILING_SAMPLE_RATE = float(os.getenv("MEMORY_PROFILING_SAMPLE_RATE", "0.1"))
+
+###--- Memory one request may hold for uploads and decoded images, 0 disables the cap
+REQUEST_MEMORY_BUDGET_MB = int(os.getenv("REQUEST_MEMORY_BUDGET_MB", "512"))
+
+###--- On demand cProfile of single requests, written to the logs directory.
+###--- A request is profiled when it carries a valid signed PROFILING_HEADER
+###--- (needs PROFILING_SECRET) or is picked by PROFILING_SAMPLE_RATE.
+###--- With neither set the middleware is not installed at all.
+PROFILING_SECRET = os.getenv("PROFILING_SECRET")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_HEADER = "x-profile"
+PROFILING_TOKEN_TTL_SECONDS = int(os.getenv("PROFILING_TOKEN_TTL_SECONDS", "300"))
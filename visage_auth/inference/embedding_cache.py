@@ -0,0 +1,208 @@
+### --- Content addressed cache of face embeddings keyed by the raw image bytes
+import os
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from visage_auth.logger import logging
+from visage_auth.constant.embedding_constants import DETECTOR_BACKEND, EMBEDDING_MODEL_NAME
+from visage_auth.constant.inference_constants import (DETECTOR_CASCADE_ENABLED,
+                                                      EMBEDDING_CACHE_DIR,
+                                                      EMBEDDING_CACHE_ENABLED,
+                                                      EMBEDDING_CACHE_SIZE,
+                                                      ONNX_USE_QUANTIZED,
+                                                      REPRESENTATION_BACKEND)
+
+
+class EmbeddingCache:
+    """
+        Bounded LRU cache of embeddings. A key is the blake2b digest of the image
+        bytes plus everything that changes the embedding of those bytes: model,
+        detector, representation backend and detector cascade.
+        When cache_dir is set entries are also written there as .npy files.
+        Files are removed when evicted, and the directory is swept down to the
+        max_size most recently used files on startup and after every max_size
+        writes, so files of earlier runs and of other workers sharing the
+        directory are bounded too.
+    """
+    TMP_FILE_TTL_SECONDS = 3600
+
+    def __init__(self,max_size:int=EMBEDDING_CACHE_SIZE,cache_dir:Optional[str]=EMBEDDING_CACHE_DIR,
+                 enabled:bool=EMBEDDING_CACHE_ENABLED) -> None:
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.enabled = enabled and max_size > 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.namespace = ":".join([EMBEDDING_MODEL_NAME, DETECTOR_BACKEND, REPRESENTATION_BACKEND,
+                                   "int8" if ONNX_USE_QUANTIZED else "fp32",
+                                   "cascade" if DETECTOR_CASCADE_ENABLED else "single",])
+        if self.enabled and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk()
+
+    def key(self,contents:bytes) -> str:
+        digest = hashlib.blake2b(contents, digest_size=16)
+        digest.update(self.namespace.encode())
+        return digest.hexdigest()
+
+    def _path(self,key:str) -> str:
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self,key:str) -> Optional[List[float]]:
+        """
+            Returns:
+                list: stored embedding, None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self.lock:
+            embed = self.entries.get(key)
+            if embed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embed.tolist()
+
+        if self.cache_dir and os.path.isfile(self._path(key)):
+            try:
+                embed = np.load(self._path(key))
+                ###--- mtime is the recency the disk sweep goes by
+                os.utime(self._path(key))
+                self._store(key, embed)
+                with self.lock:
+                    self.hits += 1
+                return embed.tolist()
+            except (OSError, ValueError, EOFError) as e:
+                logging.info(f"Ignoring unreadable embedding cache entry {key}: {e}")
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self,key:str,embed:List[float]) -> None:
+        if not self.enabled:
+            return
+        embed = np.asarray(embed, dtype=np.float32)
+        self._store(key, embed)
+        if self.cache_dir:
+            ###--- Write then rename so concurrent writers, threads included, never
+            ###--- share a temporary file and readers never see a partial one
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    np.save(tmp_file, embed)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logging.info(f"Could not persist embedding cache entry {key}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with self.lock:
+                self.writes += 1
+                sweep = self.writes % self.max_size == 0
+            if sweep:
+                try:
+                    self._sweep_disk()
+                except OSError as e:
+                    logging.info(f"Could not sweep embedding cache directory {self.cache_dir}: {e}")
+
+    def _store(self,key:str,embed:np.ndarray) -> None:
+        embed.flags.writeable = False
+        evicted = []
+        with self.lock:
+            self.entries[key] = embed
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                evicted.append(self.entries.popitem(last=False)[0])
+        if self.cache_dir:
+            for evicted_key in evicted:
+                try:
+                    os.remove(self._path(evicted_key))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.info(f"Could not remove evicted embedding cache entry {evicted_key}: {e}")
+
+    def _sweep_disk(self) -> List[str]:
+        """
+            Deletes the least recently used .npy files beyond max_size and the
+            temporary files of writes that died more than TMP_FILE_TTL_SECONDS ago
+
+            Returns:
+                list: keys still on disk, least recently used first
+        """
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.name.endswith(".tmp"):
+                    if now - mtime > self.TMP_FILE_TTL_SECONDS:
+                        os.remove(entry.path)
+                elif entry.name.endswith(".npy"):
+                    files.append((mtime, entry.name[:-len(".npy")]))
+            except FileNotFoundError:
+                ###--- Replaced or removed by another worker meanwhile
+                continue
+        files.sort()
+        stale = len(files) - self.max_size
+        for _, key in files[:max(stale, 0)]:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        return [key for _, key in files[max(stale, 0):]]
+
+    def _load_disk(self) -> None:
+        """
+            Fills the LRU with the files kept by the sweep, in their order of use
+        """
+        try:
+            keys = self._sweep_disk()
+        except OSError as e:
+            logging.info(f"Could not sweep embedding cache directory {self.cache_dir}: {e}")
+            return
+        for key in keys:
+            try:
+                self._store(key, np.load(self._path(key)))
+            except (OSError, ValueError, EOFError) as e:
+                logging.info(f"Ignoring unreadable embedding cache entry {key}: {e}")
+        logging.info(f"Loaded {len(self.entries)} embedding cache entries from {self.cache_dir}")
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"enabled": self.enabled,
+                    "size": len(self.entries),
+                    "max_size": self.max_size,
+                    "persistent": bool(self.cache_dir),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hit_rate,}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+        Process wide embedding cache
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
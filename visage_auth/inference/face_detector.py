@@ -0,0 +1,145 @@
+### --- Cascaded face detection: cheap OpenCV detector first, DETECTOR_BACKEND as fallback
+import time
+import threading
+from typing import Tuple
+
+import cv2
+import numpy as np
+from deepface.commons.functions import detect_face
+from deepface.detectors import FaceDetector, OpenCvWrapper
+
+from visage_auth.logger import logging
+from visage_auth.constant.embedding_constants import DETECTOR_BACKEND, ENFORCE_DETECTION
+from visage_auth.constant.inference_constants import (CASCADE_MIN_CONFIDENCE,
+                                                      CASCADE_MIN_FACE_SIZE,
+                                                      DETECTOR_CASCADE_ENABLED)
+
+
+class FaceDetectorCascade:
+    """
+        Runs the OpenCV haar cascade on every frame and only falls back to the
+        heavy DETECTOR_BACKEND when the haar stage finds no face, several faces,
+        a face with a low level weight or fails on the frame.
+    """
+    FALLBACK_REASONS = ("no_face", "multiple_faces", "low_confidence", "error")
+
+    def __init__(self,enabled:bool=DETECTOR_CASCADE_ENABLED,
+                 detector_backend:str=DETECTOR_BACKEND,
+                 min_confidence:float=CASCADE_MIN_CONFIDENCE,
+                 min_face_size:int=CASCADE_MIN_FACE_SIZE) -> None:
+        self.enabled = enabled
+        self.detector_backend = detector_backend
+        self.min_confidence = min_confidence
+        self.min_face_size = min_face_size
+        ###--- Shares deepface's haar face and eye classifiers
+        self.opencv_detector = FaceDetector.build_model("opencv") if enabled else None
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.counters = {"frames": 0, "cheap_accepted": 0, "fallback": 0}
+            self.counters.update({f"fallback_{reason}": 0 for reason in self.FALLBACK_REASONS})
+            self.seconds = {"cheap": 0.0, "fallback": 0.0}
+
+    def detect_cheap(self,img_array:np.ndarray) -> Tuple[np.ndarray, list, str]:
+        """
+            Haar cascade stage
+
+            Returns:
+                tuple: (face, region, fallback reason), face is None when the heavy
+                backend has to run
+        """
+        ###--- Frames are decoded to RGB with PIL, not OpenCV's BGR
+        gray = img_array
+        if img_array.ndim == 3:
+            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+        boxes, _, weights = self.opencv_detector["face_detector"].detectMultiScale3(
+            gray, scaleFactor=1.1, minNeighbors=10,
+            minSize=(self.min_face_size, self.min_face_size), outputRejectLevels=True)
+
+        if len(boxes) == 0:
+            return None, None, "no_face"
+        if len(boxes) > 1:
+            return None, None, "multiple_faces"
+        if float(np.ravel(weights)[0]) < self.min_confidence:
+            return None, None, "low_confidence"
+
+        x, y, w, h = [int(v) for v in boxes[0]]
+        face = OpenCvWrapper.align_face(self.opencv_detector["eye_detector"],
+                                        img_array[y:y + h, x:x + w])
+        return face, [x, y, w, h], None
+
+    def detect(self,img_array:np.ndarray) -> Tuple[np.ndarray, list]:
+        """
+            Detect the face of a frame, same contract as deepface detect_face
+
+            Returns:
+                tuple: (face, region)
+        """
+        reason = "disabled"
+        if self.enabled:
+            start = time.perf_counter()
+            try:
+                face, region, reason = self.detect_cheap(img_array)
+            except Exception as e:
+                ###--- The cheap stage may only save work, never lose a frame the heavy one handles
+                logging.info(f"Haar cascade failed on frame: {e}")
+                face, region, reason = None, None, "error"
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.counters["frames"] += 1
+                self.seconds["cheap"] += elapsed
+                if face is not None:
+                    self.counters["cheap_accepted"] += 1
+                else:
+                    self.counters["fallback"] += 1
+                    self.counters[f"fallback_{reason}"] += 1
+            if face is not None:
+                return face, region
+        else:
+            with self.lock:
+                self.counters["frames"] += 1
+                self.counters["fallback"] += 1
+
+        logging.info(f"Falling back to {self.detector_backend} face detection: {reason}")
+        start = time.perf_counter()
+        try:
+            return detect_face(img_array,detector_backend=self.detector_backend,
+                               enforce_detection=ENFORCE_DETECTION,)
+        finally:
+            with self.lock:
+                self.seconds["fallback"] += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """
+            Per stage counters, fallback rate and mean time per stage in milliseconds
+        """
+        with self.lock:
+            frames = self.counters["frames"]
+            fallbacks = self.counters["fallback"]
+            cheap_ms = self.seconds["cheap"] * 1000
+            fallback_ms = self.seconds["fallback"] * 1000
+            return {"enabled": self.enabled,
+                    "detector_backend": self.detector_backend,
+                    **self.counters,
+                    "fallback_rate": fallbacks / frames if frames else 0.0,
+                    "cheap_mean_ms": cheap_ms / frames if frames and self.enabled else 0.0,
+                    "fallback_mean_ms": fallback_ms / fallbacks if fallbacks else 0.0,}
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_face_detector() -> FaceDetectorCascade:
+    """
+        Process wide detector cascade, its counters cover every request of the worker
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = FaceDetectorCascade()
+    return _detector
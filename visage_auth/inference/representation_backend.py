@@ -0,0 +1,213 @@
+### --- Representation backends: turn a detected face into an embedding
+import os
+import sys
+import threading
+from typing import List
+
+import cv2
+import numpy as np
+
+from visage_auth.logger import logging
+from visage_auth.exception import AppException
+from visage_auth.constant.embedding_constants import EMBEDDING_MODEL_NAME
+from visage_auth.constant.inference_constants import (ONNX_INTRA_OP_THREADS,
+                                                      ONNX_MODEL_DIR,
+                                                      ONNX_USE_QUANTIZED,
+                                                      REPRESENTATION_BACKEND)
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+def onnx_model_path(model_name:str=EMBEDDING_MODEL_NAME, quantized:bool=False) -> str:
+    """
+        Location of the exported graph for a model inside ONNX_MODEL_DIR
+    """
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return os.path.join(ONNX_MODEL_DIR, model_name + suffix)
+
+
+def preprocess_face(face:np.ndarray, target_size:tuple) -> np.ndarray:
+    """
+        Resize a detected face to the model input keeping its aspect ratio,
+        pad the rest with black pixels and scale to [0, 1].
+        Same as deepface.commons.functions.preprocess_face with detector_backend="skip",
+        without loading TensorFlow.
+
+        Args:
+            face (np.ndarray): face crop returned by the detector
+            target_size (tuple): (height, width) expected by the model
+
+        Returns:
+            np.ndarray: float32 batch of one image, shape (1, height, width, 3)
+    """
+    if face.shape[0] > 0 and face.shape[1] > 0:
+        factor = min(target_size[0] / face.shape[0], target_size[1] / face.shape[1])
+        dsize = (int(face.shape[1] * factor), int(face.shape[0] * factor))
+        face = cv2.resize(face, dsize)
+
+        diff_0 = target_size[0] - face.shape[0]
+        diff_1 = target_size[1] - face.shape[1]
+        face = np.pad(face, ((diff_0 // 2, diff_0 - diff_0 // 2),
+                             (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)), "constant")
+
+    if face.shape[0:2] != tuple(target_size):
+        face = cv2.resize(face, (target_size[1], target_size[0]))
+
+    pixels = np.expand_dims(face.astype(np.float32), axis=0)
+    pixels /= 255
+    return pixels
+
+
+class RepresentationBackend:
+    """
+        Common interface of the engines that compute a face embedding
+    """
+    name = "base"
+
+    def represent(self,face:np.ndarray) -> List[float]:
+        raise NotImplementedError
+
+    def represent_batch(self,faces:List[np.ndarray]) -> List[List[float]]:
+        return [self.represent(face) for face in faces]
+
+
+class DeepFaceBackend(RepresentationBackend):
+    """
+        TensorFlow model through DeepFace.represent, the model is built once per process.
+        The face is already detected, so DeepFace is told to skip detection and both
+        backends embed exactly the same pixels.
+    """
+    name = "deepface"
+
+    def __init__(self,model_name:str=EMBEDDING_MODEL_NAME) -> None:
+        from deepface import DeepFace
+
+        self.represent_fn = DeepFace.represent
+        self.model_name = model_name
+        self.model = DeepFace.build_model(model_name)
+        ###--- Keras models are NHWC: (batch, height, width, channels)
+        self.target_size = tuple(int(dim) for dim in self.model.inputs[0].shape[1:3])
+
+    def represent(self,face:np.ndarray) -> List[float]:
+        return self.represent_fn(img_path=face,model_name=self.model_name,
+                                 model=self.model,enforce_detection=False,
+                                 detector_backend="skip",)
+
+    def represent_batch(self,faces:List[np.ndarray]) -> List[List[float]]:
+        """
+            All faces in a single model.predict call, with the same preprocessing
+            DeepFace.represent applies to one face
+        """
+        if len(faces) == 0:
+            return []
+        batch = np.concatenate([preprocess_face(face, self.target_size) for face in faces])
+        return self.model.predict(batch).tolist()
+
+
+class OnnxRuntimeBackend(RepresentationBackend):
+    """
+        Exported EMBEDDING_MODEL_NAME graph running on the ONNX Runtime CPU provider
+    """
+    name = "onnxruntime"
+
+    def __init__(self,model_path:str=None,quantized:bool=ONNX_USE_QUANTIZED) -> None:
+        if ort is None:
+            raise ImportError("onnxruntime is required for the onnxruntime representation backend")
+
+        self.model_path = model_path or onnx_model_path(quantized=quantized)
+        if not os.path.isfile(self.model_path):
+            raise FileNotFoundError(f"ONNX model not found at {self.model_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+
+        self.session = ort.InferenceSession(self.model_path,sess_options=options,
+                                            providers=["CPUExecutionProvider"],)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        ###--- Graphs exported from Keras are NHWC: (batch, height, width, channels)
+        self.target_size = (int(model_input.shape[1]), int(model_input.shape[2]))
+        logging.info(f"Loaded ONNX representation model {self.model_path}")
+
+    def represent(self,face:np.ndarray) -> List[float]:
+        return self.represent_batch([face])[0]
+
+    def represent_batch(self,faces:List[np.ndarray]) -> List[List[float]]:
+        if len(faces) == 0:
+            return []
+        batch = np.concatenate([preprocess_face(face, self.target_size) for face in faces])
+        embeddings = self.session.run(None, {self.input_name: batch})[0]
+        return embeddings.tolist()
+
+
+def export_onnx_model(model_name:str=EMBEDDING_MODEL_NAME, output_path:str=None,
+                      opset:int=13) -> str:
+    """
+        Export the DeepFace Keras model to ONNX with tf2onnx
+
+        Returns:
+            str: path of the exported graph
+    """
+    try:
+        import tensorflow as tf
+        import tf2onnx
+        from deepface import DeepFace
+
+        output_path = output_path or onnx_model_path(model_name)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        model = DeepFace.build_model(model_name)
+        input_signature = [tf.TensorSpec(model.inputs[0].shape, tf.float32, name="input")]
+        tf2onnx.convert.from_keras(model, input_signature=input_signature,
+                                   opset=opset, output_path=output_path)
+        logging.info(f"Exported {model_name} to {output_path}")
+        return output_path
+    except Exception as e:
+        raise AppException(e,sys) from e
+
+
+def quantize_onnx_model(model_path:str=None, quantized_model_path:str=None) -> str:
+    """
+        Dynamically quantize the weights of an exported graph to INT8
+
+        Returns:
+            str: path of the quantized graph
+    """
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        model_path = model_path or onnx_model_path()
+        quantized_model_path = quantized_model_path or onnx_model_path(quantized=True)
+        quantize_dynamic(model_path, quantized_model_path, weight_type=QuantType.QInt8)
+        logging.info(f"Quantized {model_path} to {quantized_model_path}")
+        return quantized_model_path
+    except Exception as e:
+        raise AppException(e,sys) from e
+
+
+BACKENDS = {DeepFaceBackend.name: DeepFaceBackend,
+            OnnxRuntimeBackend.name: OnnxRuntimeBackend,}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_representation_backend() -> RepresentationBackend:
+    """
+        Process wide representation backend selected by REPRESENTATION_BACKEND,
+        built on first use so the model is loaded once per worker
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if REPRESENTATION_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown representation backend {REPRESENTATION_BACKEND}")
+                logging.info(f"Building {REPRESENTATION_BACKEND} representation backend.....")
+                _backend = BACKENDS[REPRESENTATION_BACKEND]()
+    return _backend
@@ -0,0 +1,190 @@
+### --- Per request memory accounting: tracemalloc sampling and memory budgets
+import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from visage_auth.logger import logging
+from visage_auth.constant.monitoring_constants import (MEMORY_PROFILING_ENABLED,
+                                                       MEMORY_PROFILING_SAMPLE_RATE,
+                                                       REQUEST_MEMORY_BUDGET_MB)
+
+MB = 1024 * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+        Raised before work that would take a request over its memory budget
+    """
+
+
+class MemoryBudget:
+    """
+        Bytes a request is allowed to hold for uploads, decoded images and arrays.
+        Callers reserve an estimate before allocating and release it once the
+        buffer is dropped, a limit of 0 means unlimited.
+    """
+    def __init__(self,limit_bytes:int=0) -> None:
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        ###--- Frames of one request may be processed on several threadpool workers
+        self.lock = threading.Lock()
+
+    def reserve(self,nbytes:int,what:str="buffer") -> None:
+        with self.lock:
+            if self.limit_bytes and self.used_bytes + nbytes > self.limit_bytes:
+                raise MemoryBudgetExceeded(f"{what} needs {nbytes / MB:.1f} MB, "
+                                           f"{(self.limit_bytes - self.used_bytes) / MB:.1f} MB "
+                                           f"left of the {self.limit_bytes / MB:.0f} MB request budget")
+            self.used_bytes += nbytes
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+
+    def release(self,nbytes:int) -> None:
+        with self.lock:
+            self.used_bytes = max(0, self.used_bytes - nbytes)
+
+
+class RequestMemorySample:
+    """
+        tracemalloc readings of one sampled request
+    """
+    def __init__(self,route:str) -> None:
+        self.route = route
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        self.peak = self.baseline
+        self.stages = {}
+        tracemalloc.reset_peak()
+
+    def observe_peak(self) -> int:
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        return self.peak
+
+
+_budget: ContextVar[Optional[MemoryBudget]] = ContextVar("memory_budget", default=None)
+_sample: ContextVar[Optional[RequestMemorySample]] = ContextVar("memory_sample", default=None)
+
+
+def get_memory_budget() -> MemoryBudget:
+    """
+        Budget of the current request, unlimited outside of a request
+    """
+    budget = _budget.get()
+    if budget is None:
+        budget = MemoryBudget()
+        _budget.set(budget)
+    return budget
+
+
+@contextmanager
+def memory_stage(name:str):
+    """
+        Records the peak allocation of a pipeline stage when the current request is sampled
+    """
+    sample = _sample.get()
+    if sample is None:
+        yield
+        return
+
+    ###--- reset_peak is process wide, keep the peak seen so far before clearing it
+    sample.observe_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        stage_peak = tracemalloc.get_traced_memory()[1] - start
+        sample.observe_peak()
+        sample.stages[name] = max(sample.stages.get(name, 0), stage_peak)
+
+
+class MemoryStats:
+    """
+        Peak allocation per route and per stage over the sampled requests
+    """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.stages = {}
+
+    @staticmethod
+    def _add(table:dict,key:str,peak:int) -> None:
+        entry = table.setdefault(key, {"samples": 0, "peak_total": 0, "peak_max": 0, "peak_last": 0})
+        entry["samples"] += 1
+        entry["peak_total"] += peak
+        entry["peak_max"] = max(entry["peak_max"], peak)
+        entry["peak_last"] = peak
+
+    def record(self,sample:RequestMemorySample) -> None:
+        with self.lock:
+            self._add(self.routes, sample.route, sample.peak - sample.baseline)
+            for stage, peak in sample.stages.items():
+                self._add(self.stages, stage, peak)
+
+    @staticmethod
+    def _report(table:dict) -> dict:
+        return {key: {"samples": entry["samples"],
+                      "peak_mean_mb": entry["peak_total"] / entry["samples"] / MB,
+                      "peak_max_mb": entry["peak_max"] / MB,
+                      "peak_last_mb": entry["peak_last"] / MB,}
+                for key, entry in table.items()}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"enabled": MEMORY_PROFILING_ENABLED,
+                    "sample_rate": MEMORY_PROFILING_SAMPLE_RATE,
+                    "request_budget_mb": REQUEST_MEMORY_BUDGET_MB,
+                    "routes": self._report(self.routes),
+                    "stages": self._report(self.stages),}
+
+
+memory_stats = MemoryStats()
+
+
+class MemoryAccountingMiddleware:
+    """
+        ASGI middleware giving every HTTP request and WebSocket connection its
+        memory budget and, when MEMORY_PROFILING_ENABLED, tracing a sample of the
+        HTTP requests with tracemalloc.
+        tracemalloc peaks are process wide, so only one request is traced at a time
+        and requests arriving meanwhile are not sampled.
+    """
+    def __init__(self,app,budget_mb:int=REQUEST_MEMORY_BUDGET_MB,
+                 enabled:bool=MEMORY_PROFILING_ENABLED,
+                 sample_rate:float=MEMORY_PROFILING_SAMPLE_RATE) -> None:
+        self.app = app
+        self.budget_bytes = budget_mb * MB
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.sampling_lock = threading.Lock()
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    async def __call__(self,scope,receive,send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        budget_token = _budget.set(MemoryBudget(self.budget_bytes))
+        sampled = (self.enabled and scope["type"] == "http" and random.random() < self.sample_rate
+                   and self.sampling_lock.acquire(blocking=False))
+        if not sampled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _budget.reset(budget_token)
+            return
+
+        sample = RequestMemorySample(scope["path"])
+        sample_token = _sample.set(sample)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sample.observe_peak()
+            _sample.reset(sample_token)
+            _budget.reset(budget_token)
+            self.sampling_lock.release()
+            memory_stats.record(sample)
+            logging.info(f"Peak memory of {sample.route}: {(sample.peak - sample.baseline) / MB:.1f} MB")
@@ -0,0 +1,61 @@
+### --- Top functions across the request profiles collected in the logs directory
+"""
+Aggregates the .prof files written by ProfilingMiddleware and prints the top functions.
+
+Usage:
+    python -m visage_auth.monitoring.profile_report
+    python -m visage_auth.monitoring.profile_report --route register_embedding --sort tottime --top 30
+    python -m visage_auth.monitoring.profile_report --sign     # print a profiling header value
+"""
+import os
+import sys
+import glob
+import pstats
+import argparse
+
+from visage_auth.logger import LOG_DIR
+from visage_auth.monitoring.profiling import PROFILE_PREFIX, sign_profiling_request
+
+
+def collect_profiles(profile_dir:str, route:str=None) -> list:
+    paths = sorted(glob.glob(os.path.join(profile_dir, f"{PROFILE_PREFIX}*.prof")))
+    if route:
+        route = route.strip("/").replace("/", "_")
+        paths = [path for path in paths if f"_{route}_" in os.path.basename(path)]
+    return paths
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=LOG_DIR, help="directory holding the profiles")
+    parser.add_argument("--route", help="only profiles of routes containing this path")
+    parser.add_argument("--sort", default="cumulative",
+                        choices=["cumulative", "tottime", "ncalls", "pcalls"])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--sign", action="store_true",
+                        help="print a signed profiling header value using PROFILING_SECRET")
+    args = parser.parse_args()
+
+    if args.sign:
+        from visage_auth.constant.monitoring_constants import PROFILING_HEADER, PROFILING_SECRET
+        if not PROFILING_SECRET:
+            print("PROFILING_SECRET is not set")
+            return 1
+        print(f"{PROFILING_HEADER}: {sign_profiling_request(PROFILING_SECRET)}")
+        return 0
+
+    paths = collect_profiles(args.dir, args.route)
+    if not paths:
+        print(f"no profiles found in {args.dir}")
+        return 1
+
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    print(f"{len(paths)} profiles from {args.dir}")
+    stats.strip_dirs().sort_stats(args.sort).print_stats(args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
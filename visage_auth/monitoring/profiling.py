@@ -0,0 +1,104 @@
+### --- On demand request profiling, profiles are written next to the log files
+import os
+import re
+import hmac
+import time
+import uuid
+import random
+import cProfile
+import hashlib
+import threading
+from datetime import datetime
+
+from visage_auth.logger import LOG_DIR, logging
+from visage_auth.constant.monitoring_constants import (PROFILING_HEADER,
+                                                       PROFILING_SAMPLE_RATE,
+                                                       PROFILING_SECRET,
+                                                       PROFILING_TOKEN_TTL_SECONDS)
+
+PROFILE_PREFIX = "profile_"
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILING_SECRET) or PROFILING_SAMPLE_RATE > 0
+
+
+def sign_profiling_request(secret:str=PROFILING_SECRET, timestamp:int=None) -> str:
+    """
+        Value of the profiling header: "<unix timestamp>.<hmac-sha256 of the timestamp>"
+    """
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    signature = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return f"{timestamp}.{signature}"
+
+
+def verify_profiling_token(token:str, secret:str=PROFILING_SECRET,
+                           ttl_seconds:int=PROFILING_TOKEN_TTL_SECONDS) -> bool:
+    if not secret or not token:
+        return False
+    timestamp, _, _ = token.partition(".")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > ttl_seconds:
+        return False
+    return hmac.compare_digest(token, sign_profiling_request(secret, int(timestamp)))
+
+
+def profile_path(route:str, request_id:str) -> str:
+    route_tag = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    request_tag = re.sub(r"[^A-Za-z0-9-]+", "", request_id)[:64]
+    time_stamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    return os.path.join(LOG_DIR, f"{PROFILE_PREFIX}{time_stamp}_{route_tag}_{request_tag}.prof")
+
+
+class ProfilingMiddleware:
+    """
+        ASGI middleware running cProfile around a request that carries a valid
+        signed profiling header or is picked by the sample rate.
+        cProfile follows the event loop thread, so the profile also contains the
+        other coroutines interleaved with the request and misses work it sends
+        to the threadpool. Only one request is profiled at a time.
+        Install it only when profiling_enabled(), requests then pay nothing.
+    """
+    def __init__(self,app,secret:str=PROFILING_SECRET,
+                 sample_rate:float=PROFILING_SAMPLE_RATE) -> None:
+        self.app = app
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.profiling_lock = threading.Lock()
+
+    def wants_profile(self,scope) -> bool:
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        for name, value in scope.get("headers", []):
+            if name.decode("latin-1") == PROFILING_HEADER:
+                return verify_profiling_token(value.decode("latin-1"), self.secret)
+        return False
+
+    async def __call__(self,scope,receive,send) -> None:
+        if (scope["type"] != "http" or not self.wants_profile(scope)
+                or not self.profiling_lock.acquire(blocking=False)):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope.get("headers", [])).get(b"x-request-id", b"").decode("latin-1")
+        request_id = request_id or uuid.uuid4().hex[:12]
+
+        async def send_with_request_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                profiler.disable()
+        finally:
+            self.profiling_lock.release()
+            path = profile_path(scope["path"], request_id)
+            profiler.dump_stats(path)
+            logging.info(f"Profiled {scope['path']} request {request_id} "
+                         f"({(time.perf_counter() - start) * 1000:.1f} ms) to {path}")
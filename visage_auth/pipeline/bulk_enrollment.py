@@ -0,0 +1,325 @@
+### --- Bulk enrollment: import users and their face images without the HTTP API
+"""
+Reads a manifest of users, validates them with the RegisterValidation rules, hashes
+passwords and computes face embeddings across a process pool, then writes users and
+embeddings to the database in batches.
+
+Manifest (CSV with a header row, or JSONL) fields:
+    Name, username, email_id, ph_no, password (or password1 / password2),
+    images: directory of the user's face images, relative to --image-root
+            (defaults to the username)
+
+Every worker process loads its own TensorFlow runtime and copy of the embedding model,
+so each one costs about the resident memory of an API worker (see
+benchmarks/representation_backend_bench.py for the figure of a model). Workers default to
+at most 4, and TensorFlow in each is limited to --tf-threads intra-op threads and
+one inter-op thread, so workers x threads stays near the number of cores instead of
+every worker sizing its thread pools to the whole machine.
+
+Progress is checkpointed after every batch so an interrupted import resumes where it
+stopped. Writes are upserts, and a replayed row whose user exists without an embedding
+only gets its embedding written, so a batch interrupted between the two writes is safe
+to run again. Rows that fail validation, embedding or writing go to a JSONL reject file.
+
+Usage:
+    python -m visage_auth.pipeline.bulk_enrollment users.csv --image-root faces/
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from visage_auth.logger import logging
+from visage_auth.entity.user import User
+from visage_auth.business_val.user_val import RegisterValidation
+from visage_auth.data_access.user_data import UserData
+from visage_auth.data_access.user_embedding_data import UserEmbeddingData
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+SECRET_FIELDS = ("password", "password1", "password2")
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def read_manifest(manifest_path:str, start_row:int=0) -> Iterator[Tuple[int, dict]]:
+    """
+        Yields (row number, row) from a CSV or JSONL manifest, skipping the rows
+        already handled by a previous run
+    """
+    with open(manifest_path, newline="") as manifest:
+        if manifest_path.endswith((".jsonl", ".json")):
+            rows = (json.loads(line) for line in manifest if line.strip())
+        else:
+            rows = csv.DictReader(manifest)
+        for row_number, row in enumerate(rows):
+            if row_number >= start_row:
+                yield row_number, row
+
+
+def row_to_user(row:dict) -> User:
+    password1 = row.get("password1") or row.get("password")
+    password2 = row.get("password2") or password1
+    return User(row.get("Name"), row.get("username"), row.get("email_id"),
+                row.get("ph_no"), password1, password2)
+
+
+def init_worker(tf_threads:int) -> None:
+    """
+        Runs once in every worker process, before any model is built
+    """
+    try:
+        import tensorflow as tf
+    except ImportError:
+        ###--- onnxruntime backend without TensorFlow, sized by ONNX_INTRA_OP_THREADS
+        return
+    tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def enroll_user(task:Tuple[int, dict, str, bool]) -> dict:
+    """
+        Runs in a worker process: bcrypt hash and averaged embedding of one user,
+        only the embedding when the user document was written by an earlier run
+    """
+    row_number, user_dict, image_dir, write_user = task
+    try:
+        from visage_auth.business_val.user_embedding_val import UserLoginEmbeddingValidation
+
+        files = []
+        for file_name in sorted(os.listdir(image_dir)):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(image_dir, file_name), "rb") as image_file:
+                    files.append(image_file.read())
+        if not files:
+            raise ValueError(f"No images found in {image_dir}")
+
+        embedding_list = UserLoginEmbeddingValidation.generate_embedding_list(files)
+        avg_embedding = UserLoginEmbeddingValidation.average_embedding(embedding_list)
+
+        user_data_dict = None
+        if write_user:
+            user_data_dict = {"Name": user_dict["Name"],
+                              "username": user_dict["username"],
+                              "password": RegisterValidation.get_password_hash(user_dict["password1"]),
+                              "email_id": user_dict["email_id"],
+                              "ph_no": user_dict["ph_no"],
+                              "UUID": user_dict["uuid_"],}
+        embedding_dict = {"UUID": user_dict["uuid_"], "user_embed": avg_embedding}
+        return {"row": row_number, "user": user_data_dict, "embedding": embedding_dict}
+    except Exception as e:
+        return {"row": row_number, "error": f"{type(e).__name__}: {e}"}
+
+
+class BulkEnrollment:
+    def __init__(self,manifest_path:str,image_root:str,workers:int,batch_size:int,
+                 checkpoint_path:str,reject_path:str,tf_threads:int=None) -> None:
+        self.manifest_path = manifest_path
+        self.image_root = image_root
+        self.workers = workers
+        self.tf_threads = tf_threads or max(1, (os.cpu_count() or 1) // workers)
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.reject_path = reject_path
+        self.userdata = UserData()
+        self.user_embedding_data = UserEmbeddingData()
+        self.progress = {"next_row": 0, "enrolled": 0, "rejected": 0}
+        if os.path.isfile(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                self.progress.update(json.load(checkpoint))
+            logging.info(f"Resuming bulk enrollment from row {self.progress['next_row']}")
+
+    def save_checkpoint(self) -> None:
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as checkpoint:
+            json.dump(self.progress, checkpoint)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def reject(self,reject_file,row_number:int,row:dict,reason:str) -> None:
+        row = {k: v for k, v in row.items() if k not in SECRET_FIELDS}
+        reject_file.write(json.dumps({"row": row_number, "reason": reason, **row}) + "\n")
+        self.progress["rejected"] += 1
+
+    def existing_users(self,users:List[User]) -> Tuple[dict, dict, set]:
+        """
+            One query for the usernames and email ids of a whole batch and one for
+            the embeddings of the users found
+
+            Returns:
+                tuple: (user by username, user by email id, UUIDs having an embedding)
+        """
+        usernames = [user.username for user in users]
+        email_ids = [user.email_id for user in users]
+        found = list(self.userdata.collection.find({"$or": [{"username": {"$in": usernames}},
+                                                            {"email_id": {"$in": email_ids}}]},
+                                                   {"username": 1, "email_id": 1, "UUID": 1}))
+        embedded = set()
+        if found:
+            embedded = {doc["UUID"] for doc in self.user_embedding_data.collection.find(
+                {"UUID": {"$in": [doc.get("UUID") for doc in found]}}, {"UUID": 1})}
+        return ({doc.get("username"): doc for doc in found},
+                {doc.get("email_id"): doc for doc in found}, embedded)
+
+    def validate_batch(self,batch:list,reject_file) -> list:
+        """
+            RegisterValidation rules for every row, existence checked once per batch
+            and against the rows seen earlier in the same batch
+        """
+        candidates = []
+        for row_number, row in batch:
+            user = row_to_user(row)
+            try:
+                msg = RegisterValidation(user, userdata=self.userdata).validate_details()
+            except Exception as e:
+                msg = f"{type(e).__name__}: {e}"
+            if msg:
+                self.reject(reject_file, row_number, row, msg)
+            else:
+                candidates.append((row_number, row, user))
+
+        if not candidates:
+            return []
+        by_username, by_email_id, embedded = self.existing_users([user for _, _, user in candidates])
+        taken_usernames, taken_email_ids = set(by_username), set(by_email_id)
+        tasks = []
+        for row_number, row, user in candidates:
+            write_user = True
+            if user.username in taken_usernames or user.email_id in taken_email_ids:
+                existing = by_username.get(user.username)
+                ###--- Written by an interrupted run of this manifest: only the embedding is missing
+                if (existing is None or existing is not by_email_id.get(user.email_id)
+                        or existing.get("UUID") in embedded):
+                    self.reject(reject_file, row_number, row, "User already exists")
+                    continue
+                user.uuid_ = existing["UUID"]
+                embedded.add(user.uuid_)
+                write_user = False
+            taken_usernames.add(user.username)
+            taken_email_ids.add(user.email_id)
+            image_dir = os.path.join(self.image_root, row.get("images") or user.username)
+            tasks.append((row_number, user.to_dict(), image_dir, write_user))
+        return tasks
+
+    def bulk_write(self,collection,operations:list,rows:list,reject_file,
+                   rows_by_number:dict,stage:str) -> set:
+        """
+            Unordered bulk write, rows whose operation failed go to the reject file
+
+            Returns:
+                set: row numbers that failed
+        """
+        failed = set()
+        if not operations:
+            return failed
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                row_number = rows[write_error["index"]]
+                failed.add(row_number)
+                self.reject(reject_file, row_number, rows_by_number[row_number],
+                            f"{stage} write failed: {write_error.get('errmsg')}")
+        return failed
+
+    def write_batch(self,results:list,reject_file,rows_by_number:dict) -> int:
+        """
+            Upserts users keyed by username, then embeddings keyed by UUID for the
+            rows whose user is stored, so replaying a batch never duplicates anything
+
+            Returns:
+                int: users enrolled with their embedding
+        """
+        user_rows = [result["row"] for result in results if result["user"] is not None]
+        user_operations = [UpdateOne({"username": result["user"]["username"]},
+                                     {"$setOnInsert": result["user"]}, upsert=True)
+                           for result in results if result["user"] is not None]
+        failed = self.bulk_write(self.userdata.collection, user_operations, user_rows,
+                                 reject_file, rows_by_number, "User")
+
+        results = [result for result in results if result["row"] not in failed]
+        embedding_rows = [result["row"] for result in results]
+        embedding_operations = [UpdateOne({"UUID": result["embedding"]["UUID"]},
+                                          {"$set": result["embedding"]}, upsert=True)
+                                for result in results]
+        failed = self.bulk_write(self.user_embedding_data.collection, embedding_operations,
+                                 embedding_rows, reject_file, rows_by_number, "Embedding")
+        return len(embedding_rows) - len(failed)
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        processed = 0
+        rows = read_manifest(self.manifest_path, self.progress["next_row"])
+        ###--- spawn keeps TensorFlow and the Mongo client out of forked children
+        with ProcessPoolExecutor(max_workers=self.workers,mp_context=mp.get_context("spawn"),
+                                 initializer=init_worker,initargs=(self.tf_threads,)) as pool, \
+                open(self.reject_path, "a") as reject_file:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                rows_by_number = dict(batch)
+                tasks = self.validate_batch(batch, reject_file)
+
+                results = []
+                for result in pool.map(enroll_user, tasks):
+                    if "error" in result:
+                        self.reject(reject_file, result["row"], rows_by_number[result["row"]],
+                                    result["error"])
+                    else:
+                        results.append(result)
+
+                enrolled = self.write_batch(results, reject_file, rows_by_number)
+
+                reject_file.flush()
+                self.progress["enrolled"] += enrolled
+                self.progress["next_row"] = batch[-1][0] + 1
+                self.save_checkpoint()
+
+                processed += len(batch)
+                elapsed = time.perf_counter() - start
+                logging.info(f"Bulk enrollment: row {self.progress['next_row']}, "
+                             f"{processed / elapsed:.1f} users/s")
+                print(f"rows {self.progress['next_row']:>8}  enrolled {self.progress['enrolled']:>8}  "
+                      f"rejected {self.progress['rejected']:>6}  {processed / elapsed:8.1f} users/s",
+                      flush=True)
+
+        elapsed = time.perf_counter() - start
+        return {**self.progress, "processed": processed, "seconds": elapsed,
+                "users_per_second": processed / elapsed if elapsed else 0.0}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="CSV or JSONL manifest of users")
+    parser.add_argument("--image-root", default=".", help="directory holding the per user image directories")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker processes, each holds its own model copy")
+    parser.add_argument("--tf-threads", type=int,
+                        help="TensorFlow intra-op threads per worker, defaults to cores / workers")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--checkpoint", help="defaults to <manifest>.checkpoint.json")
+    parser.add_argument("--rejects", help="defaults to <manifest>.rejects.jsonl")
+    args = parser.parse_args()
+
+    bulk_enrollment = BulkEnrollment(manifest_path=args.manifest,
+                                     image_root=args.image_root,
+                                     workers=args.workers,
+                                     batch_size=args.batch_size,
+                                     checkpoint_path=args.checkpoint or args.manifest + ".checkpoint.json",
+                                     reject_path=args.rejects or args.manifest + ".rejects.jsonl",
+                                     tf_threads=args.tf_threads,)
+    summary = bulk_enrollment.run()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())